@@ -0,0 +1,161 @@
+"""
+Conversão em processo de DOCX simples (apenas texto) para PDF, sem LibreOffice.
+Usa python-docx + reportlab, dependências opcionais (extra "fast-docx").
+Documentos com tabelas, imagens, listas, cabeçalhos etc. ficam com o LibreOffice.
+"""
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+try:
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+except ImportError:  # extra "fast-docx" não instalado
+    Document = None
+
+AVAILABLE = Document is not None
+
+# Elementos que o renderizador simplificado não reproduz com fidelidade. Hyperlinks,
+# controles de conteúdo, campos e revisões guardam texto fora de paragraph.runs
+# e seriam perdidos em silêncio
+UNSUPPORTED_XPATH = (
+    ".//w:tbl | .//w:drawing | .//w:pict | .//w:object | .//w:txbxContent"
+    " | .//w:numPr | .//w:footnoteReference | .//w:endnoteReference | .//w:sectPr/w:cols[@w:num > 1]"
+    " | .//w:hyperlink | .//w:sdt | .//w:ins | .//w:del | .//w:moveTo | .//w:moveFrom"
+    " | .//w:fldSimple | .//w:smartTag | .//w:customXml | .//w:sym"
+)
+# Formatação de run que o reportlab não reproduz: texto oculto sairia impresso e
+# sobrescrito/tachado/caixa alta se perderiam. Vale para runs, marcas de parágrafo e estilos
+RUN_FORMAT_XPATH = " | ".join(
+    f".//w:rPr/w:{tag}"
+    for tag in ("vanish", "specVanish", "vertAlign", "strike", "dstrike", "caps", "smallCaps")
+)
+# Filhos do corpo permitidos: parágrafos (document.paragraphs), a seção final e
+# marcadores sem texto; qualquer outro (sdt, customXml...) pode conter texto
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY_CHILDREN = frozenset(W_NS + tag for tag in ("p", "sectPr", "bookmarkStart", "bookmarkEnd"))
+TAB_MARKUP = "&nbsp;" * 4
+
+if AVAILABLE:
+    # Folha de estilos montada uma única vez na importação
+    _BASE_STYLES = getSampleStyleSheet()
+    _STYLE_MAP = {
+        "Title": _BASE_STYLES["Title"],
+        "Heading 1": _BASE_STYLES["Heading1"],
+        "Heading 2": _BASE_STYLES["Heading2"],
+        "Heading 3": _BASE_STYLES["Heading3"],
+        "Heading 4": _BASE_STYLES["Heading4"],
+    }
+    _ALIGNMENTS = {
+        WD_ALIGN_PARAGRAPH.LEFT: TA_LEFT,
+        WD_ALIGN_PARAGRAPH.CENTER: TA_CENTER,
+        WD_ALIGN_PARAGRAPH.RIGHT: TA_RIGHT,
+        WD_ALIGN_PARAGRAPH.JUSTIFY: TA_JUSTIFY,
+    }
+    _derived_styles: dict[tuple[str, int], "ParagraphStyle"] = {}
+
+
+def _paragraph_style(style_name: str, alignment) -> "ParagraphStyle":
+    """Retorna (e memoriza) o estilo reportlab para o par estilo do Word + alinhamento."""
+    base = _STYLE_MAP.get(style_name, _BASE_STYLES["Normal"])
+    align = _ALIGNMENTS.get(alignment, base.alignment)
+    key = (base.name, align)
+    if key not in _derived_styles:
+        _derived_styles[key] = ParagraphStyle(f"{base.name}-{align}", parent=base, alignment=align)
+    return _derived_styles[key]
+
+
+def _pt(length, default: float) -> float:
+    return length.pt if length is not None else default
+
+
+def _style_chain(style):
+    """O estilo e todos os estilos dos quais ele herda (base_style)."""
+    while style is not None:
+        yield style
+        style = style.base_style
+
+
+def _has_unsupported_style(document) -> bool:
+    # Listas e formatação também chegam por estilo ("List Bullet", "List Number"...),
+    # sem numPr/rPr no próprio parágrafo
+    styles = {p.style.style_id: p.style for p in document.paragraphs}
+    styles.update(
+        (r.style.style_id, r.style) for p in document.paragraphs for r in p.runs if r.style is not None
+    )
+    for style in styles.values():
+        for s in _style_chain(style):
+            if s.element.xpath("./w:pPr/w:numPr | " + RUN_FORMAT_XPATH):
+                return True
+    return False
+
+
+def _is_simple(document) -> bool:
+    body = document.element.body
+    if any(child.tag not in BODY_CHILDREN for child in body):
+        return False
+    if body.xpath(UNSUPPORTED_XPATH) or body.xpath(RUN_FORMAT_XPATH):
+        return False
+    if _has_unsupported_style(document):
+        return False
+    # Garantia final: todo o texto do parágrafo precisa estar nos runs renderizados
+    if any(p.text != "".join(r.text for r in p.runs) for p in document.paragraphs):
+        return False
+    for section in document.sections:
+        for part in (section.header, section.footer, section.first_page_header, section.first_page_footer):
+            if any(p.text.strip() for p in part.paragraphs) or part._element.xpath(UNSUPPORTED_XPATH):
+                return False
+    # As fontes padrão do PDF só cobrem o conjunto WinAnsi
+    try:
+        "".join(p.text for p in document.paragraphs).encode("cp1252")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _run_markup(run) -> str:
+    # run.text traduz w:br/w:cr em "\n" e w:tab/w:ptab em "\t"
+    text = escape(run.text).replace("\n", "<br/>").replace("\t", TAB_MARKUP)
+    if run.bold:
+        text = f"<b>{text}</b>"
+    if run.italic:
+        text = f"<i>{text}</i>"
+    if run.underline:
+        text = f"<u>{text}</u>"
+    return text
+
+
+def try_convert(input_path: Path, output_path: Path) -> bool:
+    """
+    Converte o DOCX em processo se ele for simples o bastante.
+    Retorna False (sem gerar nada) quando o documento precisa do LibreOffice.
+    """
+    document = Document(str(input_path))
+    if not _is_simple(document):
+        return False
+
+    section = document.sections[0]
+    story = []
+    for paragraph in document.paragraphs:
+        if paragraph._element.xpath('.//w:br[@w:type="page"]'):
+            story.append(PageBreak())
+        markup = "".join(_run_markup(run) for run in paragraph.runs)
+        if not markup.strip():
+            story.append(Spacer(1, _BASE_STYLES["Normal"].leading))
+            continue
+        story.append(Paragraph(markup, _paragraph_style(paragraph.style.name, paragraph.alignment)))
+
+    pdf = SimpleDocTemplate(
+        str(output_path),
+        pagesize=(_pt(section.page_width, A4[0]), _pt(section.page_height, A4[1])),
+        leftMargin=_pt(section.left_margin, 2.5 * cm),
+        rightMargin=_pt(section.right_margin, 2.5 * cm),
+        topMargin=_pt(section.top_margin, 2.5 * cm),
+        bottomMargin=_pt(section.bottom_margin, 2.5 * cm),
+    )
+    pdf.build(story)
+    return True
@@ -6,16 +6,34 @@ import os
 import subprocess
 import logging
 import shutil
+import signal
 import asyncio
+import json
+import tempfile
+import time
+import zipfile
 from uuid import uuid4
+from urllib.parse import quote
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
 
-from fastapi import FastAPI, UploadFile, HTTPException, Depends, Security, BackgroundTasks
-from fastapi.responses import FileResponse
+import aiofiles
+import anyio
+from fastapi import FastAPI, UploadFile, HTTPException, Depends, Security, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import APIKeyHeader
 from dotenv import load_dotenv
 
+from app import fast_docx
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:  # python3-uno não instalado: conversões apenas pela linha de comando
+    uno = None
+
 load_dotenv()
 
 # Configuração de Logging
@@ -29,9 +47,84 @@ logger = logging.getLogger(__name__)
 API_KEY = os.getenv("API_KEY", "")
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 CONVERSION_TIMEOUT = 120  # 2 minutos
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB por bloco na cópia do upload
+STREAM_CHUNK_SIZE = 64 * 1024  # 64 KiB por bloco enviado ao cliente
+
+# Filtros de exportação PDF por extensão, com as opções de fidelidade de cada módulo
+# UseLosslessCompression: evita perda de qualidade em imagens
+# Quality: qualidade máxima para imagens que ainda usem JPEG
+# ReduceImageResolution: mantém a resolução original das imagens dos slides
+# ExportNotesPages: não gera páginas de anotações dos slides
+WRITER_PDF_OPTIONS = {"UseLosslessCompression": True, "Quality": 100}
+IMPRESS_PDF_OPTIONS = {**WRITER_PDF_OPTIONS, "ReduceImageResolution": False, "ExportNotesPages": False}
+PDF_FILTERS = {
+    ".docx": ("writer_pdf_Export", WRITER_PDF_OPTIONS),
+    ".doc": ("writer_pdf_Export", WRITER_PDF_OPTIONS),
+    ".odt": ("writer_pdf_Export", WRITER_PDF_OPTIONS),
+    ".rtf": ("writer_pdf_Export", WRITER_PDF_OPTIONS),
+    # Texto puro não tem imagens, mas usar o mesmo filtro do Writer o mantém na
+    # mesma execução do LibreOffice que os demais documentos de texto de um lote
+    ".txt": ("writer_pdf_Export", WRITER_PDF_OPTIONS),
+    ".pptx": ("impress_pdf_Export", IMPRESS_PDF_OPTIONS),
+    ".ppt": ("impress_pdf_Export", IMPRESS_PDF_OPTIONS),
+    ".odp": ("impress_pdf_Export", IMPRESS_PDF_OPTIONS),
+}
+
+def cli_pdf_filter(filter_name: str, options: dict) -> str:
+    """Monta o argumento de --convert-to com as opções no formato JSON do LibreOffice."""
+    if not options:
+        return f"pdf:{filter_name}"
+    typed = {
+        name: {"type": "boolean", "value": str(value).lower()} if isinstance(value, bool)
+        else {"type": "long", "value": str(value)}
+        for name, value in options.items()
+    }
+    return f"pdf:{filter_name}:{json.dumps(typed, separators=(',', ':'))}"
+
+# Argumentos de --convert-to já prontos, calculados uma vez na importação
+PDF_CLI_FILTERS = {ext: cli_pdf_filter(*spec) for ext, spec in PDF_FILTERS.items()}
+BASE_CMD = ("libreoffice", "--headless", "--convert-to")
+# Ambiente dos processos soffice, copiado uma vez (após o load_dotenv)
+BASE_ENV = os.environ.copy()
+MAX_BATCH_SIZE = 10  # limita o estrago caso um documento do lote trave o soffice
+
+# DOCX só com texto convertidos em processo, sem LibreOffice (requer o extra "fast-docx")
+FAST_DOCX = os.getenv("FAST_DOCX", "0") == "1" and fast_docx.AVAILABLE
+
+# Diretório de trabalho das conversões; /dev/shm é tmpfs e evita I/O em overlay/NFS
+WORK_ROOT = Path(os.getenv("CONVERT_WORK_DIR", "/dev/shm/convert"))
+WORK_ROOT.mkdir(parents=True, exist_ok=True)
+
+# Número máximo de processos LibreOffice simultâneos
+MAX_CONCURRENT_CONVERSIONS = int(os.getenv("MAX_CONCURRENT_CONVERSIONS", "4"))
+
+# Requisições excedentes aguardam aqui em vez de disputar CPU/RAM com outros soffice
+CONVERT_SEM = asyncio.Semaphore(MAX_CONCURRENT_CONVERSIONS)
+
+# Cópias de upload simultâneas para o diretório de trabalho (I/O e tmpfs), limite
+# independente do de conversões
+UPLOAD_LIMITER = anyio.CapacityLimiter(int(os.getenv("MAX_INFLIGHT_UPLOADS", "8")))
 
-# Executor para não bloquear o loop de eventos do FastAPI com subprocess
-executor = ThreadPoolExecutor(max_workers=4)
+# Pool de perfis do LibreOffice já inicializados, um por conversão simultânea
+# (um conjunto por processo, para que vários workers do uvicorn não compartilhem perfis)
+PROFILE_ROOT = WORK_ROOT / f"profiles-{os.getpid()}"
+PROFILE_PRUNE_EVERY = int(os.getenv("PROFILE_PRUNE_EVERY", "50"))  # usos entre limpezas do cache
+profile_pool: asyncio.Queue[Path] = asyncio.Queue()
+profile_uses: dict[Path, int] = {}
+
+# soffice persistente por perfil, acionado via UNO; sem python3-uno usa-se a CLI
+USE_UNO_LISTENER = os.getenv("USE_UNO_LISTENER", "1") == "1" and uno is not None
+UNO_START_TIMEOUT = 60  # segundos para o listener aceitar conexões
+UNO_POLL_MIN_INTERVAL = 0.01  # primeira espera entre tentativas de conexão
+UNO_POLL_MAX_INTERVAL = 0.5  # teto da espera entre tentativas
+
+# Referências para tarefas em segundo plano não serem coletadas antes de terminar
+pending_tasks: set[asyncio.Task] = set()
+
+# Conversões assíncronas (POST /convert/jobs); resultados não baixados expiram
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "600"))  # segundos após o término
+MAX_JOBS = int(os.getenv("MAX_JOBS", "100"))  # jobs mantidos em memória ao mesmo tempo
+JOB_SWEEP_INTERVAL = max(1, min(30, JOB_RETENTION))  # segundos entre varreduras de jobs expirados
 
 async def verify_api_key(api_key: str = Security(api_key_header)):
     if not API_KEY:
@@ -43,124 +136,698 @@ async def verify_api_key(api_key: str = Security(api_key_header)):
 
 app = FastAPI(title="High Fidelity PDF Converter", version="2.0.0")
 
-SUPPORTED_EXTENSIONS = {".docx", ".pptx", ".odt", ".odp", ".doc", ".ppt", ".rtf", ".txt"}
+SUPPORTED_EXTENSIONS = frozenset({".docx", ".pptx", ".odt", ".odp", ".doc", ".ppt", ".rtf", ".txt"})
+SUPPORTED_LIST = ", ".join(sorted(SUPPORTED_EXTENSIONS))  # para a mensagem de erro
+
+# Assinaturas esperadas no início de cada formato (.txt não tem assinatura)
+ZIP_MAGIC = b"PK\x03\x04"  # OOXML e ODF são pacotes ZIP
+CFBF_MAGIC = b"\xd0\xcf\x11\xe0"  # formatos binários antigos do Office
+RTF_MAGIC = b"{\\rtf"
+MAGIC_BYTES = {
+    ".docx": (ZIP_MAGIC,),
+    ".pptx": (ZIP_MAGIC,),
+    ".odt": (ZIP_MAGIC,),
+    ".odp": (ZIP_MAGIC,),
+    # O Word também salva RTF com extensão .doc
+    ".doc": (CFBF_MAGIC, RTF_MAGIC),
+    ".ppt": (CFBF_MAGIC,),
+    ".rtf": (RTF_MAGIC,),
+}
+MAGIC_SNIFF_SIZE = 8
+
+def file_extension(filename: str) -> str:
+    """
+    Extensão em minúsculas (com o ponto), sem construir um Path por requisição.
+    Como em Path.suffix, um nome só com extensão (".docx") não tem extensão.
+    """
+    dot = filename.rfind(".")
+    return filename[dot:].lower() if 0 < dot < len(filename) - 1 else ""
 
-def cleanup_temp_dir(path: Path):
-    """Remove o diretório temporário após a resposta ser enviada."""
+def cleanup_temp_dir(tmp_dir: tempfile.TemporaryDirectory):
+    """Remove o diretório temporário da requisição."""
     try:
-        shutil.rmtree(path, ignore_errors=True)
-        logger.info(f"Diretório temporário removido: {path}")
+        tmp_dir.cleanup()
+        logger.info(f"Diretório temporário removido: {tmp_dir.name}")
     except Exception as e:
-        logger.warning(f"Erro ao limpar temp {path}: {e}")
+        logger.warning(f"Erro ao limpar temp {tmp_dir.name}: {e}")
 
-def run_libreoffice_conversion(input_path: str, output_dir: str, user_profile_dir: str):
+async def kill_process_group(proc: asyncio.subprocess.Process):
+    """
+    Mata o grupo de processos iniciado com start_new_session. Matar só o PID do
+    wrapper libreoffice/oosplash deixaria o soffice.bin vivo, segurando o perfil.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+async def run_libreoffice_conversion(
+    input_paths: list[str], output_dir: str, user_profile_dir: str, pdf_filter: str,
+    timeout: float = CONVERSION_TIMEOUT
+):
     """
     Executa o LibreOffice em modo headless com perfil de usuário isolado.
     O perfil isolado (-env:UserInstallation) é crucial para concorrência e estabilidade.
+    O processo é aguardado pelo próprio loop de eventos, sem ocupar threads.
+    Vários arquivos numa mesma chamada dividem o custo de inicialização do soffice.
     """
-    # Filtro PDF com opções para preservar fidelidade do layout
-    # UseLosslessCompression: evita perda de qualidade em imagens
-    # ExportFormFields: mantém campos de formulário se houver
-    pdf_filter = 'pdf:writer_pdf_Export:{"UseLosslessCompression":{"type":"boolean","value":"true"},"Quality":{"type":"long","value":"100"}}'
-    
-    command = [
-        "libreoffice",
-        "--headless",
-        "--convert-to", pdf_filter,
+    command = (
+        *BASE_CMD, pdf_filter,
         "--outdir", output_dir,
-        # Define um diretório de configuração único para esta execução
+        # Perfil exclusivo enquanto durar esta execução (emprestado do pool)
         f"-env:UserInstallation=file://{user_profile_dir}",
-        input_path
-    ]
+        *input_paths
+    )
 
-    result = subprocess.run(
-        command,
-        capture_output=True,
-        timeout=CONVERSION_TIMEOUT,
-        env={**os.environ, "HOME": user_profile_dir} # Garante que LO use o home temporário
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env={**BASE_ENV, "HOME": user_profile_dir}, # Garante que LO use o home temporário
+        start_new_session=True # Grupo próprio para matar o soffice.bin junto com o wrapper
     )
-    return result
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            proc.communicate(), timeout=timeout
+        )
+    except BaseException:
+        # Timeout ou cancelamento: mata a árvore inteira para não deixar soffice.bin órfão
+        await kill_process_group(proc)
+        raise
+    return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
 
-@app.post("/convert")
-async def convert_to_pdf(file: UploadFile, background_tasks: BackgroundTasks, _: bool = Depends(verify_api_key)):
-    if not file.filename:
-        raise HTTPException(400, "Arquivo sem nome")
+def spawn_background(coro) -> asyncio.Task:
+    """Cria uma tarefa em segundo plano rastreada em pending_tasks."""
+    task = asyncio.create_task(coro)
+    pending_tasks.add(task)
+    task.add_done_callback(pending_tasks.discard)
+    return task
 
-    ext = Path(file.filename).suffix.lower()
-    if ext not in SUPPORTED_EXTENSIONS:
-        raise HTTPException(400, f"Formato não suportado. Use: {', '.join(SUPPORTED_EXTENSIONS)}")
+async def cancel_pending_tasks():
+    """
+    Cancela e aguarda todas as tarefas em segundo plano. Repete enquanto houver
+    tarefas, pois cancelar uma conversão pode agendar a reciclagem do perfil.
+    """
+    while pending_tasks:
+        tasks = list(pending_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-    request_id = str(uuid4())
-    base_tmp = Path("/tmp") / request_id
-    
-    # Estrutura de diretórios temporários isolados
-    temp_input_dir = base_tmp / "input"
-    temp_output_dir = base_tmp / "output"
-    temp_profile_dir = base_tmp / "profile"
-    
-    temp_input_dir.mkdir(parents=True, exist_ok=True)
-    temp_output_dir.mkdir(parents=True, exist_ok=True)
-    temp_profile_dir.mkdir(parents=True, exist_ok=True)
+@dataclass
+class UnoListener:
+    """Instância persistente do soffice que aceita conexões UNO por um pipe nomeado."""
+    pipe_name: str
+    process: asyncio.subprocess.Process | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
 
-    input_file_path = temp_input_dir / file.filename
-    output_filename = Path(file.filename).stem + ".pdf"
-    output_file_path = temp_output_dir / output_filename
+uno_listeners: dict[Path, UnoListener] = {}
 
+def uno_connect(pipe_name: str):
+    """Conecta ao listener e retorna o Desktop remoto."""
+    local_ctx = uno.getComponentContext()
+    resolver = local_ctx.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_ctx)
+    ctx = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+    return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+def convert_via_uno(pipe_name: str, input_path: str, output_path: str, filter_name: str, options: dict) -> str | None:
+    """
+    Converte o documento no soffice já em execução: apenas loadComponentFromURL
+    e storeToURL, sem pagar a inicialização do LibreOffice a cada requisição.
+    Devolve a mensagem de erro em vez de levantar, para que no chamador só o
+    timeout interrompa a conversão.
+    """
     try:
-        # Salvar arquivo recebido
-        content = await file.read()
-        with open(input_file_path, "wb") as f:
-            f.write(content)
-
-        logger.info(f"[{request_id}] Iniciando conversão: {file.filename}")
-
-        # Executar conversão em thread separada para não travar a API (AsyncIO)
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            executor,
-            run_libreoffice_conversion,
-            str(input_file_path),
-            str(temp_output_dir),
-            str(temp_profile_dir)
+        desktop = uno_connect(pipe_name)
+        document = desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(input_path), "_blank", 0, (PropertyValue(Name="Hidden", Value=True),)
         )
+        if document is None:
+            return f"O LibreOffice não conseguiu abrir {Path(input_path).name}"
+        try:
+            # Mesmas opções de fidelidade do filtro usado na linha de comando
+            filter_data = uno.Any("[]com.sun.star.beans.PropertyValue", tuple(
+                PropertyValue(Name=name, Value=value) for name, value in options.items()
+            ))
+            store_args = (
+                PropertyValue(Name="FilterName", Value=filter_name),
+                PropertyValue(Name="FilterData", Value=filter_data),
+            )
+            uno.invoke(document, "storeToURL", (uno.systemPathToFileUrl(output_path), store_args))
+        finally:
+            document.close(True)
+    except Exception as e:
+        return str(e)
+    return None
 
-        if result.returncode != 0:
-            error_msg = result.stderr.decode()
-            logger.error(f"[{request_id}] Erro LibreOffice: {error_msg}")
-            # Limpa imediatamente em caso de erro
-            shutil.rmtree(base_tmp, ignore_errors=True)
-            raise HTTPException(500, f"Falha na conversão: {error_msg}")
+async def start_uno_listener(profile_dir: Path, listener: UnoListener):
+    """Sobe o soffice do perfil e aguarda até que ele aceite conexões UNO."""
+    command = [
+        "libreoffice",
+        "--headless",
+        "--invisible",
+        "--nologo",
+        "--norestore",
+        "--nodefault",
+        f"--accept=pipe,name={listener.pipe_name};urp;StarOffice.ComponentContext",
+        f"-env:UserInstallation=file://{profile_dir}",
+    ]
+    listener.process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**BASE_ENV, "HOME": str(profile_dir)},
+        start_new_session=True
+    )
+    # Espera adaptativa: sonda rápido no início (perfil já aquecido sobe em
+    # centenas de ms) e espaça as tentativas quando a inicialização demora
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + UNO_START_TIMEOUT
+    interval = UNO_POLL_MIN_INTERVAL
+    while True:
+        try:
+            await run_in_threadpool(uno_connect, listener.pipe_name)
+            return
+        except Exception:
+            if not listener.alive or loop.time() > deadline:
+                await stop_uno_listener(listener)
+                raise RuntimeError(f"Listener UNO {listener.pipe_name} não iniciou")
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, UNO_POLL_MAX_INTERVAL)
+
+async def stop_uno_listener(listener: UnoListener):
+    if listener.process is not None:
+        await kill_process_group(listener.process)
+
+async def recycle_uno_listener(profile_dir: Path, reset: bool):
+    """Reinicia o listener do perfil e só então devolve o perfil ao pool."""
+    await stop_uno_listener(uno_listeners[profile_dir])
+    if reset:
+        reset_profile(profile_dir)
+    else:
+        shutil.rmtree(profile_dir / "user" / "Cache", ignore_errors=True)
+    try:
+        await start_uno_listener(profile_dir, uno_listeners[profile_dir])
+    except Exception as e:
+        # O perfil continua no pool, mas passa a converter pela linha de comando
+        logger.error(f"Falha ao reiniciar listener UNO de {profile_dir}: {e}")
+        del uno_listeners[profile_dir]
+    if reset:
+        # Perfil recriado do zero: aquece antes de voltar ao pool (pelo listener, se subiu)
+        await warm_profile(profile_dir)
+    profile_pool.put_nowait(profile_dir)
+
+async def convert_documents(input_paths: list[Path], output_dir: Path, profile_dir: Path) -> subprocess.CompletedProcess:
+    """
+    Converte pelo listener UNO do perfil, se houver; caso contrário, pela linha de
+    comando, com uma chamada por filtro de exportação (arquivos do mesmo tipo
+    dividem a inicialização do soffice). Os PDFs ficam em output_dir com o nome
+    de cada entrada. O lote inteiro divide um único CONVERSION_TIMEOUT, limitando
+    por quanto tempo um documento travado segura a vaga e o perfil.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CONVERSION_TIMEOUT
+
+    def remaining() -> float:
+        left = deadline - loop.time()
+        if left <= 0:
+            raise TimeoutError
+        return left
 
-        if not output_file_path.exists():
-            logger.error(f"[{request_id}] PDF não gerado no caminho esperado")
-            # Limpa imediatamente em caso de erro
-            shutil.rmtree(base_tmp, ignore_errors=True)
-            raise HTTPException(500, "O arquivo PDF não foi gerado pelo conversor")
+    listener = uno_listeners.get(profile_dir)
+    if listener is None or not listener.alive:
+        by_filter: dict[str, list[str]] = {}
+        for input_path in input_paths:
+            by_filter.setdefault(PDF_CLI_FILTERS[file_extension(input_path.name)], []).append(str(input_path))
+        for pdf_filter, paths in by_filter.items():
+            result = await run_libreoffice_conversion(
+                paths, str(output_dir), str(profile_dir), pdf_filter, timeout=remaining()
+            )
+            if result.returncode != 0:
+                break
+        return result
 
-        # Agendar limpeza para DEPOIS que a resposta for enviada completamente
-        background_tasks.add_task(cleanup_temp_dir, base_tmp)
+    for input_path in input_paths:
+        output_path = output_dir / (input_path.stem + ".pdf")
+        filter_name, options = PDF_FILTERS[file_extension(input_path.name)]
+        args = [listener.pipe_name, str(input_path), filter_name]
+        # O TimeoutError do wait_for propaga e rent_profile recicla o perfil, o que mata o
+        # soffice travado; abandon_on_cancel: até lá a thread fica presa no soffice
+        error = await asyncio.wait_for(
+            anyio.to_thread.run_sync(
+                convert_via_uno, listener.pipe_name, str(input_path), str(output_path), filter_name, options,
+                abandon_on_cancel=True
+            ),
+            timeout=remaining()
+        )
+        if error:
+            return subprocess.CompletedProcess(args, 1, b"", f"{input_path.name}: {error}".encode())
+    return subprocess.CompletedProcess([listener.pipe_name, *map(str, input_paths)], 0, b"", b"")
+
+# DOCX mínimo usado no aquecimento: exercita o filtro de importação do Word, o
+# layout do Writer e as fontes, não só a inicialização do perfil
+WARMUP_DOCX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="word/document.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "word/document.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:body><w:p><w:r><w:t>warmup</w:t></w:r></w:p></w:body></w:document>'
+    ),
+}
+
+def write_warmup_docx(path: Path):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, content in WARMUP_DOCX_PARTS.items():
+            zf.writestr(name, content)
+
+async def warm_profile(profile_dir: Path):
+    """
+    Faz uma conversão descartável para que o LibreOffice popule o perfil
+    (registro, cache de extensões, bootstraprc) e carregue filtros e fontes
+    fora do caminho crítico. Com listener UNO, a conversão passa por ele.
+    """
+    with tempfile.TemporaryDirectory(prefix="warmup-", dir=WORK_ROOT) as tmp:
+        warmup_file = Path(tmp) / "warmup.docx"
+        write_warmup_docx(warmup_file)
+        try:
+            result = await convert_documents([warmup_file], Path(tmp), profile_dir)
+            if result.returncode != 0:
+                logger.warning(f"Aquecimento do perfil {profile_dir} falhou: {result.stderr.decode()}")
+        except Exception as e:
+            logger.warning(f"Aquecimento do perfil {profile_dir} falhou: {e}")
 
-        # Retornar arquivo
-        return FileResponse(
-            output_file_path,
-            media_type="application/pdf",
-            filename=output_filename
+async def refresh_font_cache():
+    """
+    Atualiza o cache do fontconfig antes do primeiro soffice, para que a primeira
+    conversão não pague a varredura de fontes. Falhas são apenas registradas.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "fc-cache", stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
+        await asyncio.wait_for(proc.wait(), timeout=CONVERSION_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Não foi possível atualizar o cache de fontes: {e}")
+
+async def init_profile(profile_dir: Path, index: int):
+    """Prepara um perfil do pool: com UNO sobe seu listener; em ambos os modos, aquece o perfil."""
+    reset_profile(profile_dir)
+    if USE_UNO_LISTENER:
+        listener = UnoListener(pipe_name=f"convert-{os.getpid()}-{index}")
+        try:
+            await start_uno_listener(profile_dir, listener)
+            uno_listeners[profile_dir] = listener
+        except Exception as e:
+            logger.warning(f"Listener UNO indisponível para {profile_dir}, usando a CLI: {e}")
+            reset_profile(profile_dir)
+    await warm_profile(profile_dir)
+
+def reset_profile(profile_dir: Path):
+    """Recria o perfil do zero; usado quando uma conversão termina de forma anormal."""
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+def recycle_profile(profile_dir: Path, reset: bool):
+    """
+    Limpa o perfil (por completo ou só o cache) e o devolve ao pool.
+    Reinício do listener UNO e reaquecimento de perfis recriados acontecem em
+    segundo plano; o perfil só volta ao pool quando estiver pronto.
+    """
+    if profile_dir in uno_listeners:
+        spawn_background(recycle_uno_listener(profile_dir, reset))
+    elif reset:
+        spawn_background(rewarm_profile(profile_dir))
+    else:
+        shutil.rmtree(profile_dir / "user" / "Cache", ignore_errors=True)
+        profile_pool.put_nowait(profile_dir)
+
+async def rewarm_profile(profile_dir: Path):
+    """Recria o perfil e o aquece antes de devolvê-lo ao pool."""
+    reset_profile(profile_dir)
+    try:
+        await warm_profile(profile_dir)
+    finally:
+        profile_pool.put_nowait(profile_dir)
+
+@asynccontextmanager
+async def rent_profile():
+    """Empresta um perfil aquecido do pool e o devolve ao final da conversão."""
+    profile_dir = await profile_pool.get()
+    try:
+        yield profile_dir
+    except BaseException:
+        # O soffice pode ter sido morto no meio da execução e deixado o perfil travado
+        recycle_profile(profile_dir, reset=True)
+        raise
+    profile_uses[profile_dir] = profile_uses.get(profile_dir, 0) + 1
+    listener = uno_listeners.get(profile_dir)
+    if (listener is not None and not listener.alive) or profile_uses[profile_dir] % PROFILE_PRUNE_EVERY == 0:
+        recycle_profile(profile_dir, reset=False)
+    else:
+        profile_pool.put_nowait(profile_dir)
+
+@app.on_event("startup")
+async def init_profile_pool():
+    await refresh_font_cache()
+    profiles = [PROFILE_ROOT / f"profile_{i}" for i in range(MAX_CONCURRENT_CONVERSIONS)]
+    await asyncio.gather(*(init_profile(profile_dir, i) for i, profile_dir in enumerate(profiles)))
+    for profile_dir in profiles:
+        profile_pool.put_nowait(profile_dir)
+    logger.info(
+        f"Pool de perfis do LibreOffice pronto: {len(profiles)} perfis, "
+        f"{len(uno_listeners)} com listener UNO"
+    )
+
+@app.on_event("shutdown")
+async def stop_profile_pool():
+    # Uma reciclagem ainda em curso poderia subir um soffice novo depois daqui
+    await cancel_pending_tasks()
+    await asyncio.gather(*(stop_uno_listener(listener) for listener in uno_listeners.values()))
+    shutil.rmtree(PROFILE_ROOT, ignore_errors=True)
+
+async def try_fast_docx(request_id: str, input_path: Path, output_path: Path) -> bool:
+    """Tenta o caminho em processo; qualquer falha devolve o documento ao LibreOffice."""
+    try:
+        converted = await run_in_threadpool(fast_docx.try_convert, input_path, output_path)
+    except Exception as e:
+        logger.warning(f"[{request_id}] Conversão rápida falhou, usando LibreOffice: {e}")
+        output_path.unlink(missing_ok=True)
+        return False
+    if converted:
+        logger.info(f"[{request_id}] DOCX simples convertido em processo")
+    return converted
+
+async def stream_file(path: Path, media_type: str, filename: str) -> StreamingResponse:
+    """
+    Abre o arquivo e o transmite em blocos a partir do descritor aberto.
+    Com o arquivo já aberto, o diretório temporário pode ser removido antes do
+    envio terminar, sem manter uma segunda cópia em tmpfs até o fim da resposta.
+    """
+    f = await aiofiles.open(path, "rb")
+    size = path.stat().st_size
+
+    async def body():
+        try:
+            while chunk := await f.read(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await f.close()
+
+    # Mesmo formato de Content-Disposition usado pelo FileResponse do Starlette
+    quoted = quote(filename)
+    if quoted != filename:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": disposition, "Content-Length": str(size)}
+    )
+
+def validate_upload(file: UploadFile):
+    if not file.filename:
+        raise HTTPException(400, "Arquivo sem nome")
+
+    if file_extension(file.filename) not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(400, f"Formato não suportado. Use: {SUPPORTED_LIST}")
+
+def copy_upload(src, path: Path):
+    """
+    Copia o SpooledTemporaryFile do upload para o disco em blocos, sem materializar
+    o conteúdo inteiro como bytes.
+    """
+    src.seek(0)
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
 
-    except subprocess.TimeoutExpired:
+def check_magic(filename: str, header: bytes):
+    """
+    Rejeita arquivos cujo conteúdo não corresponde à extensão antes de acionar o
+    LibreOffice, que levaria até o timeout para falhar com dados inválidos.
+    """
+    signatures = MAGIC_BYTES.get(file_extension(filename))
+    if signatures and not header.startswith(signatures):
+        raise HTTPException(400, f"O conteúdo de {filename} não corresponde à extensão do arquivo")
+
+async def save_upload(file: UploadFile, path: Path):
+    """Valida a assinatura e salva o arquivo recebido sem carregar o upload inteiro na memória."""
+    async with UPLOAD_LIMITER:
+        header = await file.read(MAGIC_SNIFF_SIZE)
+        check_magic(file.filename, header)
+        await run_in_threadpool(copy_upload, file.file, path)
+
+def new_workspace() -> tempfile.TemporaryDirectory:
+    """Diretório temporário de uma conversão, com as subpastas input/ e output/."""
+    tmp_dir = tempfile.TemporaryDirectory(prefix="conv-", dir=WORK_ROOT, ignore_cleanup_errors=True)
+    (Path(tmp_dir.name) / "input").mkdir()
+    (Path(tmp_dir.name) / "output").mkdir()
+    return tmp_dir
+
+@contextmanager
+def conversion_workspace(request_id: str):
+    """
+    Cria o diretório temporário da requisição (input/ e output/) e converte
+    falhas inesperadas em HTTPException. O diretório é removido em qualquer
+    caminho, inclusive cancelamento; arquivos já abertos para a resposta
+    continuam legíveis até o fim do envio.
+    """
+    # TemporaryDirectory garante a remoção mesmo se o handler for interrompido
+    tmp_dir = new_workspace()
+    try:
+        yield Path(tmp_dir.name)
+
+    except TimeoutError:
         logger.error(f"[{request_id}] Timeout na conversão")
-        shutil.rmtree(base_tmp, ignore_errors=True)
         raise HTTPException(504, "O documento é muito complexo ou grande para o tempo limite")
-    
+
     except HTTPException:
         # Re-raise HTTPExceptions sem modificação (já foram tratadas)
         raise
-    
+
     except Exception as e:
         logger.exception(f"[{request_id}] Erro inesperado")
-        shutil.rmtree(base_tmp, ignore_errors=True)
         raise HTTPException(500, str(e))
 
+    finally:
+        cleanup_temp_dir(tmp_dir)
+
+async def save_uploads(request_id: str, files: list[UploadFile], base_tmp: Path) -> list[Path]:
+    """Salva os uploads em base_tmp/input e retorna os caminhos na ordem dos arquivos."""
+    input_file_paths = [base_tmp / "input" / file.filename for file in files]
+    for file, input_file_path in zip(files, input_file_paths):
+        await save_upload(file, input_file_path)
+        input_size = input_file_path.stat().st_size
+        logger.info(f"[{request_id}] Arquivo recebido: {file.filename} ({input_size} bytes)")
+    return input_file_paths
+
+async def convert_inputs(request_id: str, input_file_paths: list[Path], base_tmp: Path) -> list[Path]:
+    """Converte os arquivos já salvos e retorna os PDFs (em base_tmp/output) na mesma ordem."""
+    temp_output_dir = base_tmp / "output"
+    output_file_paths = [temp_output_dir / (path.stem + ".pdf") for path in input_file_paths]
+    logger.info(f"[{request_id}] Iniciando conversão: {', '.join(p.name for p in input_file_paths)}")
+
+    pending = []
+    for input_file_path, output_file_path in zip(input_file_paths, output_file_paths):
+        if FAST_DOCX and file_extension(input_file_path.name) == ".docx":
+            async with CONVERT_SEM:
+                if await try_fast_docx(request_id, input_file_path, output_file_path):
+                    continue
+        pending.append(input_file_path)
+
+    if pending:
+        # Executar conversão como subprocesso assíncrono para não travar a API
+        async with CONVERT_SEM, rent_profile() as profile_dir:
+            result = await convert_documents(pending, temp_output_dir, profile_dir)
+
+        if result.returncode != 0:
+            error_msg = result.stderr.decode()
+            logger.error(f"[{request_id}] Erro LibreOffice: {error_msg}")
+            raise HTTPException(500, f"Falha na conversão: {error_msg}")
+
+    missing = [inp.name for inp, out in zip(input_file_paths, output_file_paths) if not out.exists()]
+    if missing:
+        logger.error(f"[{request_id}] PDF não gerado no caminho esperado: {missing}")
+        raise HTTPException(500, f"O arquivo PDF não foi gerado pelo conversor: {', '.join(missing)}")
+
+    return output_file_paths
+
+async def convert_uploads(request_id: str, files: list[UploadFile], base_tmp: Path) -> list[Path]:
+    """Salva os uploads em base_tmp/input, converte e retorna os PDFs na ordem dos arquivos."""
+    input_file_paths = await save_uploads(request_id, files, base_tmp)
+    return await convert_inputs(request_id, input_file_paths, base_tmp)
+
+@app.post("/convert")
+async def convert_to_pdf(file: UploadFile, _: bool = Depends(verify_api_key)):
+    validate_upload(file)
+
+    request_id = str(uuid4())
+    with conversion_workspace(request_id) as base_tmp:
+        [pdf_path] = await convert_uploads(request_id, [file], base_tmp)
+        # Retornar arquivo; o diretório temporário é removido logo em seguida
+        return await stream_file(pdf_path, "application/pdf", pdf_path.name)
+
+def write_zip(pdf_paths: list[Path], zip_path: Path):
+    """Empacota os PDFs do lote; PDFs já são comprimidos, ZIP_STORED evita recomprimir à toa."""
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for pdf_path in pdf_paths:
+            zf.write(pdf_path, arcname=pdf_path.name)
+
+@app.post("/convert/batch")
+async def convert_batch(files: list[UploadFile], _: bool = Depends(verify_api_key)):
+    """Converte vários documentos dividindo a inicialização do LibreOffice e devolve um ZIP com os PDFs."""
+    if not files:
+        raise HTTPException(400, "Nenhum arquivo enviado")
+    if len(files) > MAX_BATCH_SIZE:
+        raise HTTPException(400, f"Máximo de {MAX_BATCH_SIZE} arquivos por lote")
+    for file in files:
+        validate_upload(file)
+    # Os PDFs são nomeados pelo nome de cada entrada; nomes repetidos se sobrescreveriam
+    stems = [Path(file.filename).stem for file in files]
+    if len(set(stems)) != len(stems):
+        raise HTTPException(400, "Os arquivos do lote devem ter nomes distintos")
+
+    request_id = str(uuid4())
+    with conversion_workspace(request_id) as base_tmp:
+        pdf_paths = await convert_uploads(request_id, files, base_tmp)
+
+        zip_path = base_tmp / "documentos.zip"
+        await run_in_threadpool(write_zip, pdf_paths, zip_path)
+        return await stream_file(zip_path, "application/zip", zip_path.name)
+
+@dataclass
+class ConversionJob:
+    """Conversão executada em segundo plano; o resultado fica no diretório do job até ser baixado."""
+    id: str
+    tmp_dir: tempfile.TemporaryDirectory
+    status: str = "queued"  # queued -> running -> done | failed
+    pdf_path: Path | None = None
+    status_code: int = 200
+    error: str | None = None
+    finished_at: float | None = None
+    task: asyncio.Task | None = None
+
+jobs: dict[str, ConversionJob] = {}
+
+def drop_job(job: ConversionJob):
+    jobs.pop(job.id, None)
+    cleanup_temp_dir(job.tmp_dir)
+
+def prune_jobs():
+    """Remove jobs terminados há mais de JOB_RETENTION segundos sem que o PDF fosse baixado."""
+    now = time.monotonic()
+    for job in list(jobs.values()):
+        if job.finished_at is not None and now - job.finished_at > JOB_RETENTION:
+            logger.info(f"[{job.id}] Resultado expirado sem download")
+            drop_job(job)
+
+async def run_job(job: ConversionJob, input_file_paths: list[Path]):
+    job.status = "running"
+    try:
+        [job.pdf_path] = await convert_inputs(job.id, input_file_paths, Path(job.tmp_dir.name))
+        job.status = "done"
+    except TimeoutError:
+        logger.error(f"[{job.id}] Timeout na conversão")
+        job.status, job.status_code = "failed", 504
+        job.error = "O documento é muito complexo ou grande para o tempo limite"
+    except HTTPException as e:
+        job.status, job.status_code, job.error = "failed", e.status_code, e.detail
+    except Exception as e:
+        logger.exception(f"[{job.id}] Erro inesperado")
+        job.status, job.status_code, job.error = "failed", 500, str(e)
+    finally:
+        job.finished_at = time.monotonic()
+
+async def sweep_jobs():
+    """Descarta periodicamente resultados expirados, mesmo sem novas requisições de jobs."""
+    while True:
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+        prune_jobs()
+
+@app.on_event("startup")
+async def start_job_sweeper():
+    spawn_background(sweep_jobs())
+
+@app.on_event("shutdown")
+async def drop_pending_jobs():
+    # Cancela as conversões em andamento antes de apagar os diretórios que elas usam
+    running = [job.task for job in jobs.values() if job.task is not None and not job.task.done()]
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+    for job in list(jobs.values()):
+        drop_job(job)
+
+@app.post("/convert/jobs", status_code=202)
+async def create_conversion_job(file: UploadFile, request: Request, _: bool = Depends(verify_api_key)):
+    """
+    Recebe o documento e devolve 202 imediatamente; a conversão segue em segundo
+    plano e o PDF é obtido em GET /convert/jobs/{job_id}.
+    """
+    validate_upload(file)
+    prune_jobs()
+    if len(jobs) >= MAX_JOBS:
+        raise HTTPException(503, "Muitas conversões em andamento, tente novamente mais tarde")
+
+    job = ConversionJob(id=str(uuid4()), tmp_dir=new_workspace())
+    try:
+        # O upload precisa ser salvo antes da resposta: o UploadFile é fechado ao fim da requisição
+        input_file_paths = await save_uploads(job.id, [file], Path(job.tmp_dir.name))
+    except BaseException:
+        cleanup_temp_dir(job.tmp_dir)
+        raise
+    jobs[job.id] = job
+
+    job.task = spawn_background(run_job(job, input_file_paths))
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": str(request.url_for("get_conversion_job", job_id=job.id)),
+    }
+
+@app.get("/convert/jobs/{job_id}")
+async def get_conversion_job(job_id: str, _: bool = Depends(verify_api_key)):
+    """202 enquanto a conversão roda; o PDF (uma única vez) quando termina; o erro se falhar."""
+    prune_jobs()
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job não encontrado ou expirado")
+
+    if job.status in ("queued", "running"):
+        return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202, headers={"Retry-After": "2"})
+
+    # Sai de jobs antes do primeiro await: GETs simultâneos recebem 404, não um arquivo já removido
+    jobs.pop(job_id)
+    if job.status == "failed":
+        drop_job(job)
+        raise HTTPException(job.status_code, job.error)
+
+    # O arquivo é aberto antes da limpeza e continua legível até o fim do envio
+    try:
+        return await stream_file(job.pdf_path, "application/pdf", job.pdf_path.name)
+    finally:
+        drop_job(job)
+
 @app.get("/health")
 async def health():
     return {"status": "ok", "mode": "headless-isolated"}
\ No newline at end of file
@@ -43,8 +43,9 @@ gcloud run deploy $SERVICE_NAME `
     --image $IMAGE_TAG `
     --platform managed `
     --region $REGION `
-    --memory 1Gi `
+    --memory 2Gi `
     --cpu 1 `
+    --update-env-vars "MAX_CONCURRENT_CONVERSIONS=2,MAX_INFLIGHT_UPLOADS=4" `
     --timeout 300 `
     --concurrency 10 `
     --min-instances 0 `
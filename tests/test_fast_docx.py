@@ -0,0 +1,49 @@
+"""Documentos que o caminho rápido de DOCX precisa recusar (e deixar para o LibreOffice)."""
+import tempfile
+import unittest
+from pathlib import Path
+
+from app import fast_docx
+
+if fast_docx.AVAILABLE:
+    from docx import Document
+
+
+@unittest.skipUnless(fast_docx.AVAILABLE, 'extra "fast-docx" não instalado')
+class TryConvertTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def convert(self, document) -> bool:
+        input_path = self.tmp / "entrada.docx"
+        document.save(str(input_path))
+        return fast_docx.try_convert(input_path, self.tmp / "saida.pdf")
+
+    def test_texto_simples_usa_caminho_rapido(self):
+        document = Document()
+        document.add_heading("Título", level=1)
+        paragraph = document.add_paragraph("Texto ")
+        paragraph.add_run("negrito").bold = True
+        self.assertTrue(self.convert(document))
+        self.assertTrue((self.tmp / "saida.pdf").exists())
+
+    def test_recusa_formatacao_de_run_nao_suportada(self):
+        for attr in ("hidden", "superscript", "strike", "double_strike", "all_caps", "small_caps"):
+            with self.subTest(attr=attr):
+                document = Document()
+                paragraph = document.add_paragraph("visível ")
+                setattr(paragraph.add_run("SECRET").font, attr, True)
+                self.assertFalse(self.convert(document))
+
+    def test_recusa_lista_definida_pelo_estilo(self):
+        for style in ("List Bullet", "List Number"):
+            with self.subTest(style=style):
+                document = Document()
+                document.add_paragraph("item", style=style)
+                self.assertFalse(self.convert(document))
+
+
+if __name__ == "__main__":
+    unittest.main()